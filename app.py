@@ -1,7 +1,8 @@
 import os
+import re
 import json
 import smtplib
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import mysql.connector
@@ -56,6 +57,50 @@ DB_CONFIG = {
     'port': 3306
 }
 
+# ---------------------------------------------------------
+# REGISTRO DE GRUPOS DE INVENTARIO
+# ---------------------------------------------------------
+# Grupos (marcas) separados por comas. Todos comparten la tabla particionada
+# 'inventario_merch', por lo que agregar un grupo no requiere DDL.
+GRUPOS_INVENTARIO = [
+    g.strip().lower()
+    for g in os.environ.get('INVENTARIO_GRUPOS', 'kossodo,kossomet').split(',')
+    if g.strip()
+]
+for _grupo in GRUPOS_INVENTARIO:
+    if not re.fullmatch(r"[a-z0-9_]+", _grupo):
+        raise ValueError(f"Nombre de grupo inválido en INVENTARIO_GRUPOS: '{_grupo}'")
+
+INVENTARIO_TABLE = "inventario_merch"
+STOCK_TABLE = "inventario_stock"
+
+# Particiones anuales por timestamp (subparticionadas por grupo). El primer año
+# también recibe cualquier registro anterior a él.
+PARTICION_ANIO_INICIO = int(os.environ.get('INVENTARIO_PARTICION_DESDE', 2024))
+SUBPARTICIONES_GRUPO = 4
+# Años de historial a conservar (entero >= 1); si no se define, no se poda nada.
+RETENCION_ANIOS = os.environ.get('INVENTARIO_RETENCION_ANIOS') or None
+if RETENCION_ANIOS is not None:
+    if not re.fullmatch(r"\d+", RETENCION_ANIOS.strip()) or int(RETENCION_ANIOS) < 1:
+        raise ValueError(
+            f"INVENTARIO_RETENCION_ANIOS debe ser un entero mayor o igual a 1 (valor: '{RETENCION_ANIOS}')"
+        )
+    RETENCION_ANIOS = int(RETENCION_ANIOS)
+
+# Columnas propias de la tabla de inventario que no pueden usarse como producto.
+COLUMNAS_SISTEMA = {'id', 'timestamp', 'grupo', 'responsable', 'observaciones'}
+
+# Lock con nombre de MySQL: evita que varios workers de gunicorn ejecuten a la
+# vez la migración y el mantenimiento de particiones al iniciar.
+MANTENIMIENTO_LOCK = "inventario_merch_maint"
+MANTENIMIENTO_LOCK_TIMEOUT = 60
+
+def grupo_valido(grupo):
+    return grupo in GRUPOS_INVENTARIO
+
+def grupos_permitidos():
+    return " o ".join(f"'{g}'" for g in GRUPOS_INVENTARIO)
+
 # ---------------------------------------------------------
 # CREDENCIALES DE EMAIL (DESDE VARIABLES DE ENTORNO)
 # ---------------------------------------------------------
@@ -77,8 +122,9 @@ def get_db_connection():
 # CREACIÓN DE TABLAS AL INICIAR LA APLICACIÓN
 # ---------------------------------------------------------
 merch_columns = [
-    "id INT AUTO_INCREMENT PRIMARY KEY",
-    "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP",
+    "id INT AUTO_INCREMENT",
+    "timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP",
+    "grupo VARCHAR(50) NOT NULL",
     "responsable VARCHAR(255)",
     "merch_lapiceros_normales INT DEFAULT 0",
     "merch_lapicero_ejecutivos INT DEFAULT 0",
@@ -89,18 +135,49 @@ merch_columns = [
     "merch_padmouse INT DEFAULT 0",
     "merch_bolsa INT DEFAULT 0",
     "merch_lapiceros_esco INT DEFAULT 0",
-    "observaciones TEXT"
+    "observaciones TEXT",
+    # MySQL exige que las columnas de particionado formen parte de la PK.
+    "PRIMARY KEY (id, timestamp, grupo)",
+    "KEY idx_grupo_timestamp (grupo, timestamp)"
 ]
 columns_merch_str = ", ".join(merch_columns)
+# Productos presentes en todos los grupos desde la creación de la tabla.
+PRODUCTOS_BASE = [col.split()[0] for col in merch_columns if col.startswith("merch_")]
 
-TABLES_MERCH = [
-    "inventario_merch_kossodo",
-    "inventario_merch_kossomet"
-]
+def inventory_partition_defs(anio_desde, anio_hasta):
+    return [
+        f"PARTITION p{anio} VALUES LESS THAN ('{anio + 1}-01-01')"
+        for anio in range(anio_desde, anio_hasta + 1)
+    ]
+
+particiones_inventario = inventory_partition_defs(PARTICION_ANIO_INICIO, datetime.now().year + 1)
+particiones_inventario.append("PARTITION p_max VALUES LESS THAN (MAXVALUE)")
 
 table_queries = {}
-for table in TABLES_MERCH:
-    table_queries[table] = f"CREATE TABLE IF NOT EXISTS {table} ({columns_merch_str});"
+table_queries[INVENTARIO_TABLE] = (
+    f"CREATE TABLE IF NOT EXISTS {INVENTARIO_TABLE} ({columns_merch_str}) "
+    f"PARTITION BY RANGE COLUMNS(timestamp) "
+    f"SUBPARTITION BY KEY(grupo) SUBPARTITIONS {SUBPARTICIONES_GRUPO} "
+    f"({', '.join(particiones_inventario)});"
+)
+
+# Registra, en la misma transacción que la copia, el nombre de archivo con el
+# que quedará cada tabla antigua ya copiada a inventario_merch.
+migraciones_columns = [
+    "tabla VARCHAR(100) PRIMARY KEY",
+    "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP"
+]
+table_queries["inventario_migraciones"] = (
+    f"CREATE TABLE IF NOT EXISTS inventario_migraciones ({', '.join(migraciones_columns)});"
+)
+
+stock_columns = [
+    "grupo VARCHAR(50) PRIMARY KEY",
+    "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP"
+]
+table_queries[STOCK_TABLE] = (
+    f"CREATE TABLE IF NOT EXISTS {STOCK_TABLE} ({', '.join(stock_columns)});"
+)
 
 solicitudes_columns = [
     "id INT AUTO_INCREMENT PRIMARY KEY",
@@ -132,21 +209,234 @@ table_queries["inventario_solicitudes_conf"] = (
     f"CREATE TABLE IF NOT EXISTS inventario_solicitudes_conf ({', '.join(conf_columns)});"
 )
 
+def ensure_column_exists(cursor, table_name, column_name):
+    try:
+        db_name = DB_CONFIG['database']
+        query_check = """
+            SELECT COUNT(*) FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s;
+        """
+        cursor.execute(query_check, (db_name, table_name, column_name))
+        (existe,) = cursor.fetchone()
+        if existe == 0:
+            print(f"Creando columna {column_name} en tabla {table_name}")
+            query_alter = f"ALTER TABLE {table_name} ADD COLUMN `{column_name}` INT DEFAULT 0;"
+            cursor.execute(query_alter)
+            return True
+        return False
+    except Error as e:
+        print(f"Error al verificar/crear columna {column_name}: {str(e)}")
+        raise
+
+def get_merch_columns(cursor, table_name):
+    db_name = DB_CONFIG['database']
+    query_cols = """
+        SELECT COLUMN_NAME
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME LIKE 'merch\\_%'
+        ORDER BY ORDINAL_POSITION
+    """
+    cursor.execute(query_cols, (db_name, table_name))
+    return [row[0] for row in cursor.fetchall()]
+
+def get_table_columns(cursor, table_name):
+    db_name = DB_CONFIG['database']
+    query_cols = """
+        SELECT COLUMN_NAME
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s
+        ORDER BY ORDINAL_POSITION
+    """
+    cursor.execute(query_cols, (db_name, table_name))
+    return [row[0] for row in cursor.fetchall()]
+
+def get_product_columns(cursor, table_name):
+    return [
+        col for col in get_table_columns(cursor, table_name)
+        if col.lower() not in COLUMNAS_SISTEMA
+    ]
+
+def table_exists(cursor, table_name):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s;",
+        (DB_CONFIG['database'], table_name)
+    )
+    (existe,) = cursor.fetchone()
+    return existe > 0
+
+def get_inventory_partition_years(cursor):
+    db_name = DB_CONFIG['database']
+    query_parts = """
+        SELECT DISTINCT PARTITION_NAME
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+    """
+    cursor.execute(query_parts, (db_name, INVENTARIO_TABLE))
+    nombres = [row[0] for row in cursor.fetchall()]
+    return sorted(int(n[1:]) for n in nombres if re.fullmatch(r"p\d{4}", n))
+
+def get_pending_archive(cursor, legacy_table):
+    # Nombre de archivo ya registrado cuya tabla aún no existe: la copia se hizo
+    # pero el proceso se interrumpió antes de renombrar la tabla de staging.
+    cursor.execute(
+        "SELECT tabla FROM inventario_migraciones WHERE tabla LIKE %s;",
+        (legacy_table.replace("_", "\\_") + "\\_migrada%",)
+    )
+    for (archivo,) in cursor.fetchall():
+        if not table_exists(cursor, archivo):
+            return archivo
+    return None
+
+def next_archive_name(cursor, legacy_table):
+    cursor.execute(
+        "SELECT tabla FROM inventario_migraciones WHERE tabla LIKE %s;",
+        (legacy_table.replace("_", "\\_") + "\\_migrada%",)
+    )
+    registrados = {row[0] for row in cursor.fetchall()}
+    archivo = f"{legacy_table}_migrada"
+    sufijo = 2
+    while archivo in registrados or table_exists(cursor, archivo):
+        archivo = f"{legacy_table}_migrada_{sufijo}"
+        sufijo += 1
+    return archivo
+
+def migrate_legacy_tables(conn, cursor):
+    # Copia las antiguas tablas por grupo (inventario_merch_<grupo>) a la tabla
+    # única. Primero se renombran a *_migrando; la copia y el nombre de archivo
+    # elegido se confirman en la misma transacción, de modo que un intento
+    # interrumpido solo completa el renombrado sin volver a copiar. Si la tabla
+    # antigua reaparece (p. ej. por un worker con código anterior), sus filas
+    # se copian de nuevo y se archiva con otro sufijo (*_migrada_2, ...).
+    for grupo in GRUPOS_INVENTARIO:
+        legacy_table = f"inventario_merch_{grupo}"
+        staging_table = f"{legacy_table}_migrando"
+        while True:
+            if not table_exists(cursor, staging_table):
+                if not table_exists(cursor, legacy_table):
+                    break
+                cursor.execute(f"RENAME TABLE {legacy_table} TO {staging_table};")
+            archivo = get_pending_archive(cursor, legacy_table)
+            if archivo is None:
+                archivo = next_archive_name(cursor, legacy_table)
+                cols = []
+                for col in get_table_columns(cursor, staging_table):
+                    if col.lower() in ('id', 'timestamp'):
+                        continue
+                    if col.lower() == 'grupo':
+                        print(f"Columna '{col}' de '{legacy_table}' omitida: es una columna del sistema.")
+                        continue
+                    ensure_column_exists(cursor, INVENTARIO_TABLE, col)
+                    cols.append(col)
+                columnas_str = ", ".join(f"`{col}`" for col in cols)
+                insert_sql = f"""
+                    INSERT INTO {INVENTARIO_TABLE} (grupo, timestamp, {columnas_str})
+                    SELECT %s, COALESCE(timestamp, NOW()), {columnas_str}
+                    FROM {staging_table} ORDER BY id;
+                """
+                cursor.execute(insert_sql, (grupo,))
+                copiadas = cursor.rowcount
+                cursor.execute("INSERT INTO inventario_migraciones (tabla) VALUES (%s);", (archivo,))
+                conn.commit()
+                print(f"{copiadas} registros de '{legacy_table}' copiados a '{INVENTARIO_TABLE}'.")
+            cursor.execute(f"RENAME TABLE {staging_table} TO {archivo};")
+            # El stock se recalcula en cada consulta, la tabla antigua ya no se usa.
+            cursor.execute(f"DROP TABLE IF EXISTS inventario_stock_{grupo};")
+            conn.commit()
+            print(f"Tabla '{legacy_table}' migrada y archivada como '{archivo}'.")
+
+def ensure_inventory_partitions(cursor):
+    # Agrega las particiones anuales que falten hasta el año siguiente al actual.
+    anios = get_inventory_partition_years(cursor)
+    if not anios:
+        return
+    nuevas = inventory_partition_defs(anios[-1] + 1, datetime.now().year + 1)
+    if not nuevas:
+        return
+    nuevas.append("PARTITION p_max VALUES LESS THAN (MAXVALUE)")
+    cursor.execute(
+        f"ALTER TABLE {INVENTARIO_TABLE} REORGANIZE PARTITION p_max INTO ({', '.join(nuevas)});"
+    )
+    print(f"Particiones agregadas a '{INVENTARIO_TABLE}': {len(nuevas) - 1}")
+
+def prune_inventory_history(conn, cursor, anios_retencion):
+    # Elimina las particiones anteriores a la ventana de retención. Antes de
+    # borrar cada año se guarda una fila de saldo por grupo al inicio del año
+    # siguiente, para que el stock calculado no cambie. Si el saldo ya existe
+    # (un intento anterior falló antes del DROP) no se vuelve a insertar.
+    anio_corte = datetime.now().year - anios_retencion + 1
+    cols = get_product_columns(cursor, INVENTARIO_TABLE)
+    columnas_str = ", ".join(f"`{col}`" for col in cols)
+    sumas_str = ", ".join(f"COALESCE(SUM(`{col}`), 0)" for col in cols)
+    for anio in get_inventory_partition_years(cursor):
+        if anio >= anio_corte:
+            break
+        observacion = f"Saldo consolidado hasta {anio}"
+        cursor.execute(
+            f"SELECT COUNT(*) FROM {INVENTARIO_TABLE} "
+            f"WHERE responsable = 'sistema' AND timestamp = %s AND observaciones = %s;",
+            (f"{anio + 1}-01-01", observacion)
+        )
+        (existe_saldo,) = cursor.fetchone()
+        if existe_saldo > 0:
+            cursor.execute(f"ALTER TABLE {INVENTARIO_TABLE} DROP PARTITION p{anio};")
+            print(f"Partición p{anio} de '{INVENTARIO_TABLE}' eliminada.")
+            continue
+        insert_sql = f"""
+            INSERT INTO {INVENTARIO_TABLE} (grupo, timestamp, responsable, observaciones, {columnas_str})
+            SELECT grupo, %s, 'sistema', %s, {sumas_str}
+            FROM {INVENTARIO_TABLE} PARTITION (p{anio})
+            GROUP BY grupo;
+        """
+        cursor.execute(insert_sql, (f"{anio + 1}-01-01", observacion))
+        conn.commit()
+        cursor.execute(f"ALTER TABLE {INVENTARIO_TABLE} DROP PARTITION p{anio};")
+        print(f"Partición p{anio} de '{INVENTARIO_TABLE}' eliminada.")
+
+def run_inventory_maintenance(conn, cursor):
+    cursor.execute("SELECT GET_LOCK(%s, %s);", (MANTENIMIENTO_LOCK, MANTENIMIENTO_LOCK_TIMEOUT))
+    (obtenido,) = cursor.fetchone()
+    if obtenido != 1:
+        print(f"No se obtuvo el lock '{MANTENIMIENTO_LOCK}'; se omite el mantenimiento de '{INVENTARIO_TABLE}'.")
+        return
+    pasos = [
+        ("migración de tablas antiguas", lambda: migrate_legacy_tables(conn, cursor)),
+        ("creación de particiones", lambda: ensure_inventory_partitions(cursor)),
+    ]
+    if RETENCION_ANIOS:
+        pasos.append(("poda de historial", lambda: prune_inventory_history(conn, cursor, RETENCION_ANIOS)))
+    try:
+        # Cada paso es independiente: un fallo no impide ejecutar los demás.
+        for nombre, paso in pasos:
+            try:
+                paso()
+            except Error as e:
+                conn.rollback()
+                print(f"Error en {nombre} de '{INVENTARIO_TABLE}': {e}")
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s);", (MANTENIMIENTO_LOCK,))
+        cursor.fetchone()
+
 def create_tables():
     conn = get_db_connection()
     if conn is None:
         print("No se pudo conectar a la base de datos")
         return
     cursor = conn.cursor()
-    for table, query in table_queries.items():
-        try:
-            cursor.execute(query)
-            conn.commit()
-            print(f"Tabla '{table}' verificada/creada correctamente.")
-        except Error as e:
-            print(f"Error al crear la tabla '{table}': {e}")
-    cursor.close()
-    conn.close()
+    try:
+        for table, query in table_queries.items():
+            try:
+                cursor.execute(query)
+                conn.commit()
+                print(f"Tabla '{table}' verificada/creada correctamente.")
+            except Error as e:
+                print(f"Error al crear la tabla '{table}': {e}")
+        if table_exists(cursor, INVENTARIO_TABLE):
+            run_inventory_maintenance(conn, cursor)
+        else:
+            print(f"No existe la tabla '{INVENTARIO_TABLE}'; se omite la migración y el mantenimiento.")
+    finally:
+        cursor.close()
+        conn.close()
 
 create_tables()
 
@@ -306,15 +596,41 @@ def send_email_solicitud(data):
 @app.route('/api/inventario', methods=['GET'])
 def obtener_inventario():
     tabla_param = request.args.get('tabla')
-    if tabla_param not in ['kossodo', 'kossomet']:
-        return jsonify({"error": "Parámetro 'tabla' inválido. Use 'kossodo' o 'kossomet'."}), 400
-    table_name = f"inventario_merch_{tabla_param}"
+    if not grupo_valido(tabla_param):
+        return jsonify({"error": f"Parámetro 'tabla' inválido. Use {grupos_permitidos()}."}), 400
+    # Filtros opcionales de fecha: limitan la consulta a las particiones del rango.
+    conditions = ["grupo = %s"]
+    values = [tabla_param]
+    # 'desde' es inclusivo; 'hasta' con solo fecha incluye todo ese día.
+    for param, operador in (('desde', '>='), ('hasta', '<')):
+        valor = request.args.get(param)
+        if not valor:
+            continue
+        try:
+            fecha = datetime.strptime(valor, '%Y-%m-%d')
+            if param == 'hasta':
+                fecha += timedelta(days=1)
+        except ValueError:
+            try:
+                fecha = datetime.fromisoformat(valor)
+            except ValueError:
+                return jsonify({"error": (
+                    f"Parámetro '{param}' inválido. Use YYYY-MM-DD o YYYY-MM-DDTHH:MM:SS "
+                    "('desde' incluye ese momento; 'hasta' incluye todo el día indicado "
+                    "o excluye la hora exacta indicada)."
+                )}), 400
+        values.append(fecha)
+        conditions.append(f"timestamp {operador} %s")
     conn = get_db_connection()
     if conn is None:
         return jsonify({"error": "Error de conexión a la base de datos"}), 500
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute(f"SELECT * FROM {table_name} ORDER BY timestamp DESC;")
+        query = (
+            f"SELECT * FROM {INVENTARIO_TABLE} WHERE {' AND '.join(conditions)} "
+            f"ORDER BY timestamp DESC;"
+        )
+        cursor.execute(query, tuple(values))
         registros = cursor.fetchall()
         return jsonify(registros), 200
     except Error as e:
@@ -326,9 +642,8 @@ def obtener_inventario():
 @app.route('/api/inventario', methods=['POST'])
 def agregar_inventario():
     tabla_param = request.args.get('tabla')
-    if tabla_param not in ['kossodo', 'kossomet']:
-        return jsonify({"error": "Parámetro 'tabla' inválido. Use 'kossodo' o 'kossomet'."}), 400
-    table_name = f"inventario_merch_{tabla_param}"
+    if not grupo_valido(tabla_param):
+        return jsonify({"error": f"Parámetro 'tabla' inválido. Use {grupos_permitidos()}."}), 400
     data = request.get_json()
     if not data:
         return jsonify({"error": "No se proporcionaron datos en formato JSON."}), 400
@@ -340,9 +655,11 @@ def agregar_inventario():
             valores.append(val)
     if not columnas:
         return jsonify({"error": "No se han enviado campos válidos para insertar."}), 400
+    columnas.append('grupo')
+    valores.append(tabla_param)
     placeholders = ", ".join(["%s"] * len(valores))
     columnas_str = ", ".join(f"`{col}`" for col in columnas)
-    query = f"INSERT INTO {table_name} ({columnas_str}) VALUES ({placeholders});"
+    query = f"INSERT INTO {INVENTARIO_TABLE} ({columnas_str}) VALUES ({placeholders});"
     conn = get_db_connection()
     if conn is None:
         return jsonify({"error": "Error de conexión a la base de datos"}), 500
@@ -368,29 +685,23 @@ def nuevo_producto():
     nombre_producto = data.get('nombre_producto')
     columna = data.get('columna')
     cantidad = data.get('cantidad', 0)
-    if grupo not in ['kossodo', 'kossomet']:
-        return jsonify({"error": "El grupo debe ser 'kossodo' o 'kossomet'."}), 400
+    if not grupo_valido(grupo):
+        return jsonify({"error": f"El grupo debe ser {grupos_permitidos()}."}), 400
     if not columna or not nombre_producto:
         return jsonify({"error": "Faltan datos: nombre_producto o columna."}), 400
-    table_name = f"inventario_merch_{grupo}"
+    if not re.fullmatch(r"[A-Za-z0-9_]+", columna):
+        return jsonify({"error": "La columna solo puede contener letras, números y '_'."}), 400
+    if columna.lower() in COLUMNAS_SISTEMA:
+        return jsonify({"error": f"La columna '{columna}' está reservada por el sistema."}), 400
     conn = get_db_connection()
     if conn is None:
         return jsonify({"error": "Error de conexión a la base de datos"}), 500
     cursor = conn.cursor()
     try:
-        db_name = DB_CONFIG['database']
-        query_check = """
-            SELECT COUNT(*) FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s;
-        """
-        cursor.execute(query_check, (db_name, table_name, columna))
-        (existe,) = cursor.fetchone()
-        if existe == 0:
-            alter_sql = f"ALTER TABLE {table_name} ADD COLUMN `{columna}` INT DEFAULT 0;"
-            cursor.execute(alter_sql)
+        if ensure_column_exists(cursor, INVENTARIO_TABLE, columna):
             conn.commit()
-        insert_sql = f"INSERT INTO {table_name} (`{columna}`) VALUES (%s);"
-        cursor.execute(insert_sql, (cantidad,))
+        insert_sql = f"INSERT INTO {INVENTARIO_TABLE} (grupo, `{columna}`) VALUES (%s, %s);"
+        cursor.execute(insert_sql, (grupo, cantidad))
         conn.commit()
         nuevo_id = cursor.lastrowid
         return jsonify({"message": "Nuevo producto agregado correctamente", "id": nuevo_id}), 201
@@ -404,37 +715,25 @@ def nuevo_producto():
 @app.route('/api/stock', methods=['GET'])
 def obtener_stock():
     grupo = request.args.get('grupo')
-    if grupo not in ['kossodo', 'kossomet']:
-        return jsonify({"error": "Grupo inválido. Use 'kossodo' o 'kossomet'."}), 400
-    inventario_table = f"inventario_merch_{grupo}"
-    stock_table = f"inventario_stock_{grupo}"
+    if not grupo_valido(grupo):
+        return jsonify({"error": f"Grupo inválido. Use {grupos_permitidos()}."}), 400
     conn = get_db_connection()
     if conn is None:
         return jsonify({"error": "Error de conexión a la base de datos"}), 500
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor()
     try:
-        db_name = DB_CONFIG['database']
-        query_cols = """
-            SELECT COLUMN_NAME
-            FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME LIKE 'merch\\_%'
-        """
-        cursor.execute(query_cols, (db_name, inventario_table))
-        cols = [row['COLUMN_NAME'] for row in cursor.fetchall()]
-        inventory_totals = {}
-        for col in cols:
-            query_sum = f"SELECT SUM(`{col}`) AS total FROM {inventario_table}"
-            cursor.execute(query_sum)
-            result = cursor.fetchone()
-            total = result['total'] if result['total'] is not None else 0
-            inventory_totals[col] = total
+        cols = get_merch_columns(cursor, INVENTARIO_TABLE)
+        # Una sola consulta por grupo; solo recorre las subparticiones del grupo.
+        sums_str = ", ".join(f"COALESCE(SUM(`{col}`), 0)" for col in cols)
+        cursor.execute(f"SELECT {sums_str} FROM {INVENTARIO_TABLE} WHERE grupo = %s", (grupo,))
+        inventory_totals = dict(zip(cols, cursor.fetchone()))
         request_totals = {col: 0 for col in cols}
         query_conf = "SELECT productos FROM inventario_solicitudes_conf WHERE grupo = %s"
         cursor.execute(query_conf, (grupo,))
         conf_rows = cursor.fetchall()
-        for row in conf_rows:
+        for (productos,) in conf_rows:
             try:
-                productos_dict = json.loads(row['productos']) if row['productos'] else {}
+                productos_dict = json.loads(productos) if productos else {}
             except Exception:
                 productos_dict = {}
             for prod, qty in productos_dict.items():
@@ -443,39 +742,31 @@ def obtener_stock():
         stock = {}
         for col in cols:
             stock[col] = inventory_totals.get(col, 0) - request_totals.get(col, 0)
-        create_stock_query = f"""
-            CREATE TABLE IF NOT EXISTS {stock_table} (
-                id INT PRIMARY KEY,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-        """
-        cursor.execute(create_stock_query)
-        conn.commit()
-        query_cols_stock = """
-            SELECT COLUMN_NAME
-            FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME LIKE 'merch\\_%'
-        """
-        cursor.execute(query_cols_stock, (db_name, stock_table))
-        stock_cols_existing = {row['COLUMN_NAME'] for row in cursor.fetchall()}
+        stock_cols_existing = set(get_merch_columns(cursor, STOCK_TABLE))
         for col in cols:
             if col not in stock_cols_existing:
-                alter_query = f"ALTER TABLE {stock_table} ADD COLUMN `{col}` INT DEFAULT 0;"
+                alter_query = f"ALTER TABLE {STOCK_TABLE} ADD COLUMN `{col}` INT DEFAULT 0;"
                 cursor.execute(alter_query)
                 conn.commit()
         columns_list = ', '.join([f"`{col}`" for col in cols])
         placeholders = ', '.join(['%s'] * len(cols))
-        values = [stock[col] for col in cols]
+        values = [grupo] + [stock[col] for col in cols]
         update_parts = ', '.join([f"`{col}` = VALUES(`{col}`)" for col in cols])
         insert_query = f"""
-            INSERT INTO {stock_table} (id, {columns_list})
-            VALUES (1, {placeholders})
+            INSERT INTO {STOCK_TABLE} (grupo, {columns_list})
+            VALUES (%s, {placeholders})
             ON DUPLICATE KEY UPDATE {update_parts};
         """
         cursor.execute(insert_query, values)
         conn.commit()
-        cursor.execute(f"SELECT * FROM {stock_table} WHERE id = 1;")
-        stock_row = cursor.fetchone()
+        cursor.execute(f"SELECT timestamp FROM {STOCK_TABLE} WHERE grupo = %s;", (grupo,))
+        (stock_timestamp,) = cursor.fetchone()
+        # Mismo formato que la antigua tabla inventario_stock_<grupo>: solo los
+        # productos base y los que tienen movimientos en este grupo.
+        stock_row = {"id": 1, "timestamp": stock_timestamp}
+        for col in cols:
+            if col in PRODUCTOS_BASE or inventory_totals.get(col) or request_totals.get(col):
+                stock_row[col] = int(stock[col])
         return jsonify(stock_row), 200
     except Exception as e:
         conn.rollback()
@@ -640,25 +931,6 @@ def obtener_confirmaciones():
         cursor.close()
         conn.close()
 
-def ensure_column_exists(cursor, table_name, column_name):
-    try:
-        db_name = DB_CONFIG['database']
-        query_check = """
-            SELECT COUNT(*) FROM information_schema.COLUMNS
-            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s;
-        """
-        cursor.execute(query_check, (db_name, table_name, column_name))
-        (existe,) = cursor.fetchone()
-        if existe == 0:
-            print(f"Creando columna {column_name} en tabla {table_name}")
-            query_alter = f"ALTER TABLE {table_name} ADD COLUMN `{column_name}` INT DEFAULT 0;"
-            cursor.execute(query_alter)
-            return True
-        return False
-    except Error as e:
-        print(f"Error al verificar/crear columna {column_name}: {str(e)}")
-        raise
-
 # ---------------------------------------------------------
 # EJECUTAR LA APLICACIÓN
 # ---------------------------------------------------------